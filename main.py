@@ -9,16 +9,545 @@ AKShare MCP Server
 """
 
 import akshare as ak
+import asyncio
+import collections
+import concurrent.futures
+import contextvars
+import numpy
 import pandas
 from fastmcp import FastMCP
 import datetime
+import functools
+import inspect
+import json
+import operator
+import sys
+import threading
+import time
+
+# 表格类结果默认的响应字节预算，放不下时返回代表性行与逐列统计
+DEFAULT_MAX_BYTES = 64 * 1024
+# 调用方可指定的最大响应字节预算
+MAX_RESPONSE_BYTES = 1024 * 1024
+# 估算单行字节数时最多抽取的行数
+ROW_SIZE_SAMPLES = 64
+# 全市场快照缓存有效期（秒）
+SNAPSHOT_TTL = 60
+# 历史行情缓存有效期（秒）
+HISTORY_TTL = 600
+# 合约信息缓存有效期（秒）
+CONTRACT_INFO_TTL = 6 * 3600
+# 期货手续费与保证金缓存有效期（秒），数据源每日更新
+FEE_TABLE_TTL = 24 * 3600
+# 缓存占用内存上限（字节），超出时按最近最少使用淘汰
+CACHE_MAX_BYTES = 256 * 1024 * 1024
+# 字符串列去重后占比不超过该值时转为分类类型
+CATEGORY_MAX_RATIO = 0.5
+# 执行工具函数的线程数
+TOOL_WORKERS = 32
+# 依赖模块级共享状态、不能并发调用的AKShare接口，须经_cached_call串行调用且不做对冲请求
+AK_NOT_THREAD_SAFE = {
+    "match_main_contract",  # 逐品种改写zh_match_main_contract_payload["node"]
+    "stock_zh_ah_spot",  # 逐页改写hk_payload["reqPage"]
+}
+# 对冲请求：在历史耗时达到该百分位仍未返回时发起第二次请求
+HEDGE_PERCENTILE = 95
+# 历史耗时样本数不足时使用的对冲等待秒数
+HEDGE_DEFAULT_DELAY = 3.0
+HEDGE_MIN_SAMPLES = 20
+LATENCY_WINDOW = 200
+# 成本等级 -> (优先级，数值越小越优先, 并发上限, 排队上限, 建议重试秒数)
+# 各等级并发上限之和大于TOOL_WORKERS，执行槽紧张时按优先级分配
+COST_CLASSES = {
+    "light": (0, TOOL_WORKERS, 128, 1),
+    "standard": (1, 24, 64, 5),
+    "heavy": (2, 8, 16, 15),
+}
+
+try:
+    import pyarrow  # noqa: F401
+    _STRING_DTYPE = "string[pyarrow]"
+except ImportError:
+    _STRING_DTYPE = None
+
+# 行情快照缓存：(接口名, 参数) -> (写入时间, 压缩后的完整DataFrame, 占用字节数, 数据获取时间)
+# 超时降级用的最近成功结果也存放在这里，与快照共用CACHE_MAX_BYTES内存上限
+_snapshot_cache = collections.OrderedDict()
+_snapshot_cache_bytes = 0
+_snapshot_lock = threading.Lock()
+_ak_call_locks = {func_name: threading.Lock() for func_name in AK_NOT_THREAD_SAFE}
+
+
+def _compact_column(series: pandas.Series) -> pandas.Series:
+    """将单列转换为更紧凑的数据类型，转换不改变任何取值"""
+    kind = series.dtype.kind
+    if kind == "i":
+        return pandas.to_numeric(series, downcast="integer")
+    if kind == "u":
+        return pandas.to_numeric(series, downcast="unsigned")
+    if kind == "f":
+        values = series.to_numpy()
+        finite = values[~numpy.isnan(values)]
+        if (len(finite) == len(values) and len(values) and numpy.abs(finite).max() < 2 ** 53
+                and numpy.array_equal(finite, numpy.round(finite))):
+            return pandas.to_numeric(series.astype("int64"), downcast="integer")
+        if numpy.array_equal(values.astype("float32").astype("float64"), values, equal_nan=True):
+            return series.astype("float32")
+        return series
+    # 含缺失值的字符串列保持原样：分类与Arrow类型会把None变为NaN或<NA>
+    if kind == "O" and pandas.api.types.infer_dtype(series, skipna=False) == "string":
+        if series.nunique(dropna=True) <= len(series) * CATEGORY_MAX_RATIO:
+            return series.astype("category")
+        if _STRING_DTYPE is not None:
+            return series.astype(_STRING_DTYPE)
+    return series
+
+
+def _compact_dataframe(df: pandas.DataFrame) -> pandas.DataFrame:
+    """入缓存前压缩DataFrame：低基数字符串转分类、数值向下转型、其余字符串使用Arrow存储"""
+    if type(df) is not pandas.core.frame.DataFrame:
+        return df
+    compact = df.copy(deep=False)
+    for position in range(compact.shape[1]):
+        compact.isetitem(position, _compact_column(compact.iloc[:, position]))
+    return compact
+
+
+def _memory_bytes(result) -> int:
+    """估算缓存条目占用的内存字节数"""
+    if type(result) is pandas.core.frame.DataFrame:
+        return int(result.memory_usage(index=True, deep=True).sum())
+    return sys.getsizeof(result)
+
+
+def _fresh_entry(key: tuple, ttl: float) -> tuple | None:
+    """取未过期的缓存条目并标记为最近使用"""
+    with _snapshot_lock:
+        entry = _snapshot_cache.get(key)
+        if entry is not None and time.monotonic() - entry[0] < ttl:
+            _snapshot_cache.move_to_end(key)
+            return entry
+    return None
+
+
+def _cached_call(func_name: str, ttl: float = SNAPSHOT_TTL, **kwargs) -> pandas.DataFrame:
+    """带有效期地调用AKShare接口，返回未截断的完整结果
+
+    缓存中的DataFrame会被多个工具共享，调用方只能读取，不能原地修改。
+    """
+    key = (func_name, tuple(sorted(kwargs.items())))
+    entry = _fresh_entry(key, ttl)
+    if entry is not None:
+        return entry[1]
+    call_lock = _ak_call_locks.get(func_name)
+    if call_lock is None:
+        result = _compact_dataframe(getattr(ak, func_name)(**kwargs))
+    else:
+        with call_lock:
+            # 等锁期间其他调用可能已经写入缓存
+            entry = _fresh_entry(key, ttl)
+            if entry is not None:
+                return entry[1]
+            result = _compact_dataframe(getattr(ak, func_name)(**kwargs))
+    _store_entry(key, result, _memory_bytes(result))
+    return result
+
+
+def _store_entry(key: tuple, value, nbytes: int) -> None:
+    """写入缓存条目，超出内存上限时按最近最少使用淘汰，刚写入的条目始终保留"""
+    global _snapshot_cache_bytes
+    fetched_at = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    with _snapshot_lock:
+        previous = _snapshot_cache.pop(key, None)
+        if previous is not None:
+            _snapshot_cache_bytes -= previous[2]
+        _snapshot_cache[key] = (time.monotonic(), value, nbytes, fetched_at)
+        _snapshot_cache_bytes += nbytes
+        while _snapshot_cache_bytes > CACHE_MAX_BYTES and len(_snapshot_cache) > 1:
+            _, evicted = _snapshot_cache.popitem(last=False)
+            _snapshot_cache_bytes -= evicted[2]
+
+
+def _is_cached(func_name: str, ttl: float, **kwargs) -> bool:
+    """缓存中是否有未过期的结果"""
+    return _fresh_entry((func_name, tuple(sorted(kwargs.items()))), ttl) is not None
+
+
+def _cached_at(func_name: str, **kwargs) -> str | None:
+    """缓存条目的数据获取时间，条目不存在时返回None"""
+    with _snapshot_lock:
+        entry = _snapshot_cache.get((func_name, tuple(sorted(kwargs.items()))))
+    return None if entry is None else entry[3]
+
+
+# 当前调用的(响应字节预算, 代表性行排序列)，由_guarded按调用设置
+_response_budget = contextvars.ContextVar("response_budget", default=(DEFAULT_MAX_BYTES, ""))
+
+
+def _json_bytes(data) -> int:
+    """按工具响应的序列化方式估算JSON字节数"""
+    return len(json.dumps(data, ensure_ascii=False, indent=2, default=str).encode("utf-8"))
+
+
+def _column_summary(df: pandas.DataFrame) -> dict:
+    """逐列统计：非空数、去重数，数值列另含最小/最大/均值与四分位数"""
+    try:
+        distinct = df.nunique(dropna=True)
+    except TypeError:
+        distinct = df.astype(str).nunique(dropna=True)
+    table = pandas.DataFrame({"count": df.count(), "distinct": distinct})
+    numeric = df.select_dtypes(include="number")
+    if not numeric.empty:
+        quantiles = numeric.quantile([0.25, 0.5, 0.75]).T
+        quantiles.columns = ["p25", "p50", "p75"]
+        table = table.join(numeric.agg(["min", "max", "mean"]).T).join(quantiles)
+    return {
+        str(column): {key: value for key, value in stats.items() if pandas.notna(value)}
+        for column, stats in table.to_dict(orient="index").items()
+    }
+
+
+def _top_k_positions(values: numpy.ndarray, k: int, ascending: bool) -> numpy.ndarray:
+    """使用argpartition取出前k个位置，再仅对这k个元素排序"""
+    keys = values if ascending else -values
+    # 缺失值排在最后
+    keys = numpy.where(numpy.isnan(keys), numpy.inf, keys)
+    if k < len(keys):
+        candidates = numpy.argpartition(keys, k - 1)[:k]
+    else:
+        candidates = numpy.arange(len(keys))
+    return candidates[numpy.argsort(keys[candidates], kind="stable")]
+
+
+def _ranked_positions(series: pandas.Series, k: int, ascending: bool) -> numpy.ndarray:
+    """按列取排序后前k个位置：数值列使用argpartition，非数值列（如名称、代码）按原值稳定排序，缺失值排在最后"""
+    values = pandas.to_numeric(series, errors="coerce").to_numpy(dtype=float)
+    if numpy.isnan(values).all() and series.notna().any():
+        ordered = series.reset_index(drop=True).sort_values(ascending=ascending, na_position="last", kind="stable")
+        return ordered.index.to_numpy()[:k]
+    return _top_k_positions(values, k, ascending)
+
+
+def _representative_positions(df: pandas.DataFrame, k: int, rank_by: str) -> numpy.ndarray:
+    """选出k行代表性记录：指定rank_by时取该列最大的k行，否则取首尾各一半"""
+    if k <= 0:
+        return numpy.arange(0)
+    if rank_by:
+        return _ranked_positions(df[rank_by], k, ascending=False)
+    head = (k + 1) // 2
+    return numpy.concatenate([numpy.arange(head), numpy.arange(len(df) - (k - head), len(df))])
+
+
+def _records(df: pandas.DataFrame, null_missing: bool) -> list:
+    """转换为记录列表，null_missing为True时缺失值输出为None"""
+    if null_missing:
+        df = df.astype(object).where(df.notna(), None)
+    return df.to_dict(orient="records")
+
+
+def _shrink_summary(response: dict, max_bytes: int) -> dict:
+    """只保留统计信息仍超出预算时，依次去掉分位数、均值与极值，再减少统计的列"""
+    summary = response["summary"]
+    for dropped in (("p25", "p50", "p75"), ("min", "max", "mean")):
+        summary = {column: {key: value for key, value in stats.items() if key not in dropped}
+                   for column, stats in summary.items()}
+        response["summary"] = summary
+        if _json_bytes(response) <= max_bytes:
+            return response
+    columns = list(summary)
+    while columns:
+        columns.pop()
+        response["summary"] = {column: summary[column] for column in columns}
+        response["summary_omitted_columns"] = len(summary) - len(columns)
+        if _json_bytes(response) <= max_bytes:
+            return response
+    raise ValueError(f"max_bytes过小，至少需要{_json_bytes(response)}字节")
+
+
+def _budgeted(result, null_missing: bool = False):
+    """按响应字节预算返回表格结果
+
+    能放下时返回全部记录；否则返回代表性行、逐列统计和真实总行数，
+    统计信息本身放不下时逐步精简，始终不超过预算。
+    """
+    if type(result) is not pandas.core.frame.DataFrame:
+        return result
+    max_bytes, rank_by = _response_budget.get()
+    if rank_by and rank_by not in result.columns:
+        raise ValueError(f"rank_by列不存在: {rank_by}")
+    total = len(result)
+    if total == 0:
+        return []
+    sample = numpy.unique(numpy.linspace(0, total - 1, num=min(total, ROW_SIZE_SAMPLES)).astype(int))
+    row_bytes = max(1.0, _json_bytes(_records(result.iloc[sample], null_missing)) / len(sample))
+    if row_bytes * total <= max_bytes:
+        records = _records(result, null_missing)
+        if _json_bytes(records) <= max_bytes:
+            return records
+
+    response = {
+        "truncated": True,
+        "total_rows": total,
+        "returned_rows": total,
+        "selection": f"top_by:{rank_by}" if rank_by else "head_tail",
+        "records": [],
+        "summary": _column_summary(result),
+    }
+    k = min(total - 1, max(0, int((max_bytes - _json_bytes(response)) // row_bytes)))
+    while True:
+        response["returned_rows"] = k
+        response["records"] = _records(result.iloc[_representative_positions(result, k, rank_by)], null_missing)
+        size = _json_bytes(response)
+        if size <= max_bytes:
+            return response
+        if k == 0:
+            return _shrink_summary(response, max_bytes)
+        k = int(k * max_bytes / size)
+
+
+_tool_executor = concurrent.futures.ThreadPoolExecutor(max_workers=TOOL_WORKERS, thread_name_prefix="akshare")
+# 工具名 -> 最近若干次调用耗时（秒）
+_latency_samples = {}
+
+
+class _Scheduler:
+    """按成本等级做准入控制与优先级调度，所有方法都在事件循环线程中调用
+
+    每个等级有独立的并发上限与有界等待队列，队列已满时立即拒绝；
+    执行槽空出时优先分配给优先级高的等级，同等级内先到先得。
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.running = collections.Counter()
+        self.waiting = {cost: collections.deque() for cost in COST_CLASSES}
+        self.order = sorted(COST_CLASSES, key=lambda cost: COST_CLASSES[cost][0])
+
+    def _can_run(self, cost: str) -> bool:
+        return sum(self.running.values()) < self.capacity and self.running[cost] < COST_CLASSES[cost][1]
+
+    async def acquire(self, cost: str, timeout: float | None) -> str:
+        """申请执行槽，返回"admitted"、"busy"(队列已满)或"timeout"(排队超过截止时间)"""
+        priority = COST_CLASSES[cost][0]
+        # 同等级排队者先到先得；更高优先级的排队者只有在能拿到执行槽时才排在前面，
+        # 仅受自身并发上限限制的排队者不占用其他等级的空闲执行槽
+        ahead = bool(self.waiting[cost]) or any(
+            self.waiting[other] and self._can_run(other)
+            for other in self.order if COST_CLASSES[other][0] < priority
+        )
+        if not ahead and self._can_run(cost):
+            self.running[cost] += 1
+            return "admitted"
+        if len(self.waiting[cost]) >= COST_CLASSES[cost][2]:
+            return "busy"
+        future = asyncio.get_running_loop().create_future()
+        self.waiting[cost].append(future)
+        try:
+            done, _ = await asyncio.wait({future}, timeout=timeout)
+        except asyncio.CancelledError:
+            self._abandon(cost, future)
+            raise
+        if not done:
+            self._abandon(cost, future)
+            return "timeout"
+        return "admitted"
+
+    def _abandon(self, cost: str, future: asyncio.Future) -> None:
+        if future.done():
+            # 已分配到执行槽但调用方不再需要
+            self.release(cost)
+        else:
+            self.waiting[cost].remove(future)
+            future.cancel()
+
+    def release(self, cost: str) -> None:
+        self.running[cost] -= 1
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        """按优先级把空闲执行槽分配给排队者，高优先级等级已达并发上限时继续检查低优先级等级"""
+        for waiting_cost in self.order:
+            queue = self.waiting[waiting_cost]
+            while queue and self._can_run(waiting_cost):
+                self.running[waiting_cost] += 1
+                queue.popleft().set_result(None)
+
+
+_scheduler = _Scheduler(TOOL_WORKERS)
+
+
+def _release_when_finished(cost: str, futures: list, loop: asyncio.AbstractEventLoop) -> None:
+    """所有工作线程结束后再归还执行槽，被放弃但仍在运行的请求继续占用名额"""
+    unfinished = [future for future in futures if not future.done()]
+    if not unfinished:
+        _scheduler.release(cost)
+        return
+    counter = [len(unfinished)]
+
+    def finished():
+        counter[0] -= 1
+        if counter[0] == 0:
+            _scheduler.release(cost)
+
+    for future in unfinished:
+        future.add_done_callback(lambda _: loop.call_soon_threadsafe(finished))
+
+
+# 通用参数 -> (类型标注, 默认值, 说明)
+_GUARD_PARAMS = {
+    "deadline": (float | None, None, """最长等待秒数，为空表示不限时。超时后放弃本次调用，
+                  若存在相同参数的上一次成功结果，则返回{"deadline_exceeded": true, "stale_result": 上次结果}"""),
+    "hedge": (bool, False, """是否启用对冲请求，默认False。首次请求耗时超过该工具历史P95仍未返回时再发起一次，
+               取先返回的结果；对冲期间同一上游请求会并发两次"""),
+    "max_bytes": (int | None, None, """表格类结果的响应字节预算，默认DEFAULT_MAX_BYTES。超出预算时返回
+                   {"truncated": true, "total_rows": 总行数, "records": 代表性行, "summary": 逐列统计}"""),
+    "rank_by": (str, "", "超出预算时按该列取最大的若干行作为代表性行，非数值列按原值排序，为空时取首尾各一半"),
+}
+_BUSY_DOC = '    服务繁忙、该类请求排队已满时立即返回{"busy": true, "retry_after": 建议重试秒数}\n'
+
+
+def _timed_call(name: str, func, args: tuple, kwargs: dict):
+    """在工作线程中执行工具函数并记录耗时"""
+    started = time.monotonic()
+    result = func(*args, **kwargs)
+    samples = _latency_samples.setdefault(name, collections.deque(maxlen=LATENCY_WINDOW))
+    samples.append(time.monotonic() - started)
+    return result
+
+
+def _hedge_delay(name: str) -> float:
+    """对冲请求的等待时间：取该工具历史耗时的HEDGE_PERCENTILE分位数"""
+    samples = _latency_samples.get(name)
+    if samples is None or len(samples) < HEDGE_MIN_SAMPLES:
+        return HEDGE_DEFAULT_DELAY
+    return float(numpy.percentile(list(samples), HEDGE_PERCENTILE))
+
+
+def _remember_result(key: tuple, result) -> None:
+    """以JSON文本保存最近一次成功结果，供超时降级使用，按文本大小计入缓存内存上限"""
+    encoded = json.dumps(result, ensure_ascii=False, default=str)
+    _store_entry(("deadline_fallback", key), encoded, sys.getsizeof(encoded))
+
+
+def _deadline_fallback(key: tuple, name: str, deadline: float):
+    """截止时间已到：有历史结果时降级返回，否则报超时"""
+    with _snapshot_lock:
+        entry = _snapshot_cache.get(("deadline_fallback", key))
+    if entry is not None:
+        return {"deadline_exceeded": True, "deadline": deadline, "stale_result": json.loads(entry[1])}
+    raise TimeoutError(f"{name}未能在{deadline}秒内完成，且没有可用的历史结果")
+
+
+def _guarded(func=None, *, cost: str = "standard", cached=None, budget_params: tuple = ("max_bytes", "rank_by")):
+    """为工具函数增加deadline与hedge参数，经调度器准入后在线程池中执行，避免阻塞事件循环
+
+    超时后尚未开始执行的请求会被取消；已在执行中的上游请求无法中断，其结果会被丢弃。
+    cost为成本等级，见COST_CLASSES。AK_NOT_THREAD_SAFE中的接口不提供hedge参数。
+    cached接收本次调用的参数字典，返回工具依赖的缓存条目[(接口名, 有效期, 参数), ...]；
+    任一条目未命中时本次调用需要抓取上游，按heavy等级调度。
+    budget_params为工具实际使用的预算参数，不返回表格的工具为空。
+    """
+    if func is None:
+        return functools.partial(_guarded, cost=cost, cached=cached, budget_params=budget_params)
+    signature = inspect.signature(func)
+    name = func.__name__
+    extra = [
+        param for param in _GUARD_PARAMS
+        if not (param == "hedge" and name in AK_NOT_THREAD_SAFE)
+        and (param in budget_params or param not in ("max_bytes", "rank_by"))
+    ]
+
+    @functools.wraps(func)
+    async def wrapper(*args, deadline: float | None = None, hedge: bool = False,
+                      max_bytes: int | None = None, rank_by: str = "", **kwargs):
+        if deadline is not None and deadline <= 0:
+            raise ValueError("deadline必须大于0")
+        hedge = hedge and "hedge" in extra
+        if max_bytes is not None and max_bytes <= 0:
+            raise ValueError("max_bytes必须大于0")
+        budget = (min(max_bytes or DEFAULT_MAX_BYTES, MAX_RESPONSE_BYTES), rank_by)
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        key = (name, repr(sorted(bound.arguments.items())), budget)
+        loop = asyncio.get_running_loop()
+        expires = None if deadline is None else loop.time() + deadline
+
+        def remaining():
+            return None if expires is None else max(0.0, expires - loop.time())
+
+        call_cost = cost
+        if cached is not None and not all(
+            _is_cached(func_name, ttl, **params) for func_name, ttl, params in cached(bound.arguments)
+        ):
+            call_cost = "heavy"
+        status = await _scheduler.acquire(call_cost, remaining())
+        if status == "busy":
+            return {"busy": True, "cost_class": call_cost, "retry_after": COST_CLASSES[call_cost][3]}
+        if status == "timeout":
+            return _deadline_fallback(key, name, deadline)
+
+        threads = []
+
+        def launch():
+            # 每个尝试使用独立的上下文副本，对冲请求可并发进入
+            context = contextvars.copy_context()
+            context.run(_response_budget.set, budget)
+            thread = _tool_executor.submit(context.run, _timed_call, name, func, bound.args, bound.kwargs)
+            threads.append(thread)
+            return asyncio.wrap_future(thread)
+
+        try:
+            attempts = {launch()}
+            if hedge:
+                delay = _hedge_delay(name)
+                if expires is None or delay < remaining():
+                    done, _ = await asyncio.wait(attempts, timeout=delay)
+                    if not done:
+                        attempts.add(launch())
+
+            error = None
+            pending = attempts
+            while pending:
+                done, pending = await asyncio.wait(pending, timeout=remaining(),
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    break
+                for attempt in done:
+                    if attempt.exception() is None:
+                        for other in pending:
+                            other.cancel()
+                        _remember_result(key, attempt.result())
+                        return attempt.result()
+                    error = attempt.exception()
+            if not pending:
+                raise error
+
+            # 截止时间已到：放弃仍在进行的请求
+            for attempt in pending:
+                attempt.cancel()
+            return _deadline_fallback(key, name, deadline)
+        finally:
+            _release_when_finished(call_cost, threads, loop)
+
+    # 只向工具的参数表暴露该工具实际支持的通用参数
+    parameters = list(signature.parameters.values()) + [
+        inspect.Parameter(param, inspect.Parameter.KEYWORD_ONLY,
+                          default=_GUARD_PARAMS[param][1], annotation=_GUARD_PARAMS[param][0])
+        for param in extra
+    ]
+    wrapper.__signature__ = signature.replace(parameters=parameters)
+    wrapper.__annotations__ = {**func.__annotations__, **{param: _GUARD_PARAMS[param][0] for param in extra}}
+    wrapper.__doc__ = ((func.__doc__ or "").rstrip() + "\n\n    通用参数:\n"
+                       + "".join(f"        {param}: {_GUARD_PARAMS[param][2]}\n" for param in extra)
+                       + _BUSY_DOC)
+    return wrapper
 
-MAX_DATA_ROW = 50
 
 # 创建MCP服务器实例
 mcp = FastMCP("AKShare股票期货数据服务", dependencies=["akshare>=1.16.76"])
 # 工具函数：获取当前时间
 @mcp.tool()
+@_guarded(cost="light", budget_params=())
 def get_current_time() -> dict:
     """获取当前时间
     
@@ -32,6 +561,7 @@ def get_current_time() -> dict:
 
 # 工具函数：股票交易日历查询
 @mcp.tool()
+@_guarded
 def stock_trade_date_hist() -> dict:
     """获取股票交易日历数据
     
@@ -42,12 +572,11 @@ def stock_trade_date_hist() -> dict:
         dict: 包含股票交易日历数据的字典，包括从1990-12-19到当前的所有交易日期
     """
     result = ak.tool_trade_date_hist_sina()
-    if type(result) is pandas.core.frame.DataFrame:
-        result = result[:min(MAX_DATA_ROW, len(result))]
-    return result.to_dict(orient="records")
+    return _budgeted(result)
 
 # 工具函数：上海证券交易所股票数据总貌
 @mcp.tool()
+@_guarded
 def stock_sse_summary() -> dict:
     """获取上海证券交易所-股票数据总貌
     
@@ -58,12 +587,10 @@ def stock_sse_summary() -> dict:
         dict: 包含上海证券交易所股票数据总貌的字典
     """
     result = ak.stock_sse_summary()
-    if type(result) is pandas.core.frame.DataFrame:
-        result = result[:min(MAX_DATA_ROW, len(result))]
-
-    return result.to_dict(orient="records")
+    return _budgeted(result)
 # 工具函数：深圳证券交易所证券类别统计
 @mcp.tool()
+@_guarded
 def stock_szse_summary(date: str) -> dict:
     """获取深圳证券交易所-市场总貌-证券类别统计
     
@@ -77,12 +604,11 @@ def stock_szse_summary(date: str) -> dict:
         dict: 包含证券类别统计数据的字典，包括数量、成交金额、总市值和流通市值
     """
     result = ak.stock_szse_summary(date=date)
-    if type(result) is pandas.core.frame.DataFrame:
-        result = result[:min(MAX_DATA_ROW, len(result))]
-    return result.to_dict(orient="records")
+    return _budgeted(result)
 
 # 工具函数：深圳证券交易所地区交易排序
 @mcp.tool()
+@_guarded
 def stock_szse_area_summary(date: str) -> dict:
     """获取深圳证券交易所-市场总貌-地区交易排序
     
@@ -96,12 +622,11 @@ def stock_szse_area_summary(date: str) -> dict:
         dict: 包含地区交易排序数据的字典，包括序号、地区、各类交易额及占比
     """
     result = ak.stock_szse_area_summary(date=date)
-    if type(result) is pandas.core.frame.DataFrame:
-        result = result[:min(MAX_DATA_ROW, len(result))]
-    return result.to_dict(orient="records")
+    return _budgeted(result)
 
 # 工具函数：深圳证券交易所股票行业成交数据
 @mcp.tool()
+@_guarded
 def stock_szse_sector_summary(symbol: str, date: str) -> dict:
     """获取深圳证券交易所-统计资料-股票行业成交数据
     
@@ -116,44 +641,43 @@ def stock_szse_sector_summary(symbol: str, date: str) -> dict:
         dict: 包含股票行业成交数据的字典，包括交易天数、成交金额、成交股数、成交笔数等
     """
     result = ak.stock_szse_sector_summary(symbol=symbol, date=date)
-    if type(result) is pandas.core.frame.DataFrame:
-        result = result[:min(MAX_DATA_ROW, len(result))]
-    return result.to_dict(orient="records")
+    return _budgeted(result)
 
 # 工具函数：风险警示板股票行情
 @mcp.tool()
+@_guarded(cost="light", cached=lambda args: [("stock_zh_a_st_em", SNAPSHOT_TTL, {})])
 def stock_zh_a_st_em() -> dict:
     """获取风险警示板股票行情数据
     
     数据来源: 东方财富网-行情中心-沪深个股-风险警示板
     网址: https://quote.eastmoney.com/center/gridlist.html#st_board
+    说明: 完整快照缓存SNAPSHOT_TTL(60)秒，返回数据可能比实时行情延迟最多1分钟
     
     Returns:
         dict: 包含风险警示板股票行情数据的字典，包括代码、名称、最新价、涨跌幅等完整行情指标
     """
-    result = ak.stock_zh_a_st_em()
-    if type(result) is pandas.core.frame.DataFrame:
-        result = result[:min(MAX_DATA_ROW, len(result))]
-    return result.to_dict(orient="records")
+    result = _cached_call("stock_zh_a_st_em")
+    return _budgeted(result)
 
 # 工具函数：新股行情数据
 @mcp.tool()
+@_guarded(cost="light", cached=lambda args: [("stock_zh_a_new_em", SNAPSHOT_TTL, {})])
 def stock_zh_a_new_em() -> dict:
     """获取新股板块股票行情数据
     
     数据来源: 东方财富网-行情中心-沪深个股-新股
     网址: https://quote.eastmoney.com/center/gridlist.html#newshares
+    说明: 完整快照缓存SNAPSHOT_TTL(60)秒，返回数据可能比实时行情延迟最多1分钟
     
     Returns:
         dict: 包含新股板块股票行情数据的字典，包括代码、名称、最新价、涨跌幅等完整行情指标
     """
-    result = ak.stock_zh_a_new_em()
-    if type(result) is pandas.core.frame.DataFrame:
-        result = result[:min(MAX_DATA_ROW, len(result))]
-    return result.to_dict(orient="records")
+    result = _cached_call("stock_zh_a_new_em")
+    return _budgeted(result)
 
 # 工具函数：新股上市首日数据
 @mcp.tool()
+@_guarded
 def stock_xgsr_ths() -> dict:
     """获取新股上市首日数据
     
@@ -164,12 +688,11 @@ def stock_xgsr_ths() -> dict:
         dict: 包含新股上市首日数据的字典，包括发行价、首日价格表现、涨跌幅及破发情况
     """
     result = ak.stock_xgsr_ths()
-    if type(result) is pandas.core.frame.DataFrame:
-        result = result[:min(MAX_DATA_ROW, len(result))]
-    return result.to_dict(orient="records")
+    return _budgeted(result)
 
 # 工具函数：科创板股票历史行情数据
 @mcp.tool()
+@_guarded
 def stock_zh_kcb_daily(symbol: str, adjust: str = "") -> dict:
     """获取科创板股票历史行情数据
     
@@ -189,12 +712,11 @@ def stock_zh_kcb_daily(symbol: str, adjust: str = "") -> dict:
         dict: 包含科创板股票历史行情数据的字典，包括日期、价格、成交量等
     """
     result = ak.stock_zh_kcb_daily(symbol=symbol, adjust=adjust)
-    if type(result) is pandas.core.frame.DataFrame:
-        result = result[:min(MAX_DATA_ROW, len(result))]
-    return result.to_dict(orient="records")
+    return _budgeted(result)
 
 # 工具函数：A+H股历史行情数据
 @mcp.tool()
+@_guarded
 def stock_zh_ah_daily(symbol: str, start_year: str, end_year: str, adjust: str = "") -> dict:
     """获取A+H股历史行情数据
     
@@ -214,12 +736,11 @@ def stock_zh_ah_daily(symbol: str, start_year: str, end_year: str, adjust: str =
         dict: 包含A+H股历史行情数据的字典，包括日期、价格、成交量等
     """
     result = ak.stock_zh_ah_daily(symbol=symbol, start_year=start_year, end_year=end_year, adjust=adjust)
-    if type(result) is pandas.core.frame.DataFrame:
-        result = result[:min(MAX_DATA_ROW, len(result))]
-    return result.to_dict(orient="records")
+    return _budgeted(result)
 
 # 工具函数：美股历史行情数据
 @mcp.tool()
+@_guarded
 def stock_us_hist(symbol: str, period: str = "daily", start_date: str = "", end_date: str = "", adjust: str = "") -> dict:
     """获取美股历史行情数据
     
@@ -239,13 +760,13 @@ def stock_us_hist(symbol: str, period: str = "daily", start_date: str = "", end_
     Returns:
         dict: 包含美股历史行情数据的字典，包括日期、价格、成交量等
     """
-    result = ak.stock_us_hist(symbol=symbol, period=period, start_date=start_date, end_date=end_date, adjust=adjust)
-    if type(result) is pandas.core.frame.DataFrame:
-        result = result[:min(MAX_DATA_ROW, len(result))]
-    return result.to_dict(orient="records")
+    result = _cached_call("stock_us_hist", ttl=HISTORY_TTL, symbol=symbol, period=period,
+                          start_date=start_date, end_date=end_date, adjust=adjust)
+    return _budgeted(result)
 
 # 工具函数：美股分时行情数据
 @mcp.tool()
+@_guarded
 def stock_us_hist_min_em(symbol: str, start_date: str = "1979-09-01 09:32:00", end_date: str = "2222-01-01 09:32:00") -> dict:
     """获取美股分时行情数据
     
@@ -261,12 +782,11 @@ def stock_us_hist_min_em(symbol: str, start_date: str = "1979-09-01 09:32:00", e
         dict: 包含美股分时行情数据的字典，包括时间、价格、成交量等
     """
     result = ak.stock_us_hist_min_em(symbol=symbol, start_date=start_date, end_date=end_date)
-    if type(result) is pandas.core.frame.DataFrame:
-        result = result[:min(MAX_DATA_ROW, len(result))]
-    return result.to_dict(orient="records")
+    return _budgeted(result)
 
 # 工具函数：A股分时行情数据
 @mcp.tool()
+@_guarded
 def stock_bid_ask_em(symbol: str) -> dict:
     """获取A股分时行情数据
     
@@ -280,11 +800,10 @@ def stock_bid_ask_em(symbol: str) -> dict:
         dict: 包含股票行情报价数据的字典，包括买卖盘口等详细信息
     """
     result = ak.stock_bid_ask_em(symbol=symbol)
-    if type(result) is pandas.core.frame.DataFrame:
-        result = result[:min(MAX_DATA_ROW, len(result))]
-    return result.to_dict(orient="records")
+    return _budgeted(result)
 # 工具函数：港股分时行情数据
 @mcp.tool()
+@_guarded
 def stock_hk_hist_min_em(symbol: str, period: str = "5", adjust: str = "", 
                         start_date: str = "1979-09-01 09:32:00", 
                         end_date: str = "2222-01-01 09:32:00") -> dict:
@@ -308,12 +827,11 @@ def stock_hk_hist_min_em(symbol: str, period: str = "5", adjust: str = "",
     """
     result = ak.stock_hk_hist_min_em(symbol=symbol, period=period, adjust=adjust,
                                    start_date=start_date, end_date=end_date)
-    if type(result) is pandas.core.frame.DataFrame:
-        result = result[:min(MAX_DATA_ROW, len(result))]
-    return result.to_dict(orient="records")
+    return _budgeted(result)
 
 # 工具函数：上市公司主营构成
 @mcp.tool()
+@_guarded
 def stock_zygc_em(symbol: str) -> dict:
     """获取上市公司主营构成数据
     
@@ -327,12 +845,11 @@ def stock_zygc_em(symbol: str) -> dict:
         dict: 包含公司主营构成数据的字典，包括收入、成本、利润及比例等财务指标
     """
     result = ak.stock_zygc_em(symbol=symbol)
-    if type(result) is pandas.core.frame.DataFrame:
-        result = result[:min(MAX_DATA_ROW, len(result))]
-    return result.to_dict(orient="records")
+    return _budgeted(result)
 
 # 工具函数：主力控盘与机构参与度
 @mcp.tool()
+@_guarded
 def stock_comment_detail_zlkp_jgcyd_em(symbol: str) -> dict:
     """获取股票主力控盘与机构参与度数据
     
@@ -346,12 +863,11 @@ def stock_comment_detail_zlkp_jgcyd_em(symbol: str) -> dict:
         dict: 包含主力控盘和机构参与度数据的字典，机构参与度单位为%
     """
     result = ak.stock_comment_detail_zlkp_jgcyd_em(symbol=symbol)
-    if type(result) is pandas.core.frame.DataFrame:
-        result = result[:min(MAX_DATA_ROW, len(result))]
-    return result.to_dict(orient="records")
+    return _budgeted(result)
 
 # 工具函数：个股新闻资讯
 @mcp.tool()
+@_guarded
 def stock_news_em(symbol: str) -> dict:
     """获取个股新闻资讯数据
     
@@ -365,12 +881,11 @@ def stock_news_em(symbol: str) -> dict:
         dict: 包含个股新闻资讯的字典，包括标题、内容、发布时间等
     """
     result = ak.stock_news_em(symbol=symbol)
-    if type(result) is pandas.core.frame.DataFrame:
-        result = result[:min(MAX_DATA_ROW, len(result))]
-    return result.to_dict(orient="records")
+    return _budgeted(result)
 
 # 工具函数：财经内容精选
 @mcp.tool()
+@_guarded
 def stock_news_main_cx() -> dict:
     """获取财新网财经内容精选数据
     
@@ -381,12 +896,11 @@ def stock_news_main_cx() -> dict:
         dict: 包含财经内容精选的字典，包括标签、摘要、发布时间等
     """
     result = ak.stock_news_main_cx()
-    if type(result) is pandas.core.frame.DataFrame:
-        result = result[:min(MAX_DATA_ROW, len(result))]
-    return result.to_dict(orient="records")
+    return _budgeted(result)
 
 # 工具函数：个股资金流数据
 @mcp.tool()
+@_guarded
 def stock_fund_flow_individual(symbol: str) -> dict:
     """获取个股资金流数据
     
@@ -405,12 +919,11 @@ def stock_fund_flow_individual(symbol: str) -> dict:
         dict: 包含个股资金流数据的字典，包括流入流出资金、净额等
     """
     result = ak.stock_fund_flow_individual(symbol=symbol)
-    if type(result) is pandas.core.frame.DataFrame:
-        result = result[:min(MAX_DATA_ROW, len(result))]
-    return result.to_dict(orient="records")
+    return _budgeted(result)
 
 # 工具函数：雪球股票热度关注排行榜
 @mcp.tool()
+@_guarded
 def stock_hot_follow_xq(symbol: str) -> dict:
     """获取雪球股票热度关注排行榜数据
     
@@ -426,12 +939,11 @@ def stock_hot_follow_xq(symbol: str) -> dict:
         dict: 包含股票热度关注数据的字典，包括关注人数、最新价等
     """
     result = ak.stock_hot_follow_xq(symbol=symbol)
-    if type(result) is pandas.core.frame.DataFrame:
-        result = result[:min(MAX_DATA_ROW, len(result))]
-    return result.to_dict(orient="records")
+    return _budgeted(result)
 
 # 工具函数：百度热搜股票数据
 @mcp.tool()
+@_guarded
 def stock_hot_search_baidu(symbol: str, date: str, time: str) -> dict:
     """获取百度热搜股票数据
     
@@ -453,12 +965,11 @@ def stock_hot_search_baidu(symbol: str, date: str, time: str) -> dict:
         dict: 包含热搜股票数据的字典，包括股票名称、涨跌幅、所属板块等
     """
     result = ak.stock_hot_search_baidu(symbol=symbol, date=date, time=time)
-    if type(result) is pandas.core.frame.DataFrame:
-        result = result[:min(MAX_DATA_ROW, len(result))]
-    return result.to_dict(orient="records")
+    return _budgeted(result)
 
 # 工具函数：富途牛牛快讯数据
 @mcp.tool()
+@_guarded
 def stock_info_global_futu() -> dict:
     """获取富途牛牛快讯数据
     
@@ -469,61 +980,185 @@ def stock_info_global_futu() -> dict:
         dict: 包含最近50条快讯数据的字典，包括标题、内容、发布时间等
     """
     result = ak.stock_info_global_futu()
-    if type(result) is pandas.core.frame.DataFrame:
-        result = result[:min(MAX_DATA_ROW, len(result))]
-    return result.to_dict(orient="records")
+    return _budgeted(result)
 # 工具函数：A+H股实时行情数据
 @mcp.tool()
+@_guarded(cost="light", cached=lambda args: [("stock_zh_ah_spot", SNAPSHOT_TTL, {})])
 def stock_zh_ah_spot() -> dict:
     """获取A+H股实时行情数据
     
     数据来源: 腾讯财经-A+H股数据
     网址: https://stockapp.finance.qq.com/mstats/#mod=list&id=hk_ah&module=HK&type=AH
+    说明: 完整快照缓存SNAPSHOT_TTL(60)秒，返回数据可能比实时行情延迟最多1分钟
     
     Returns:
         dict: 包含所有A+H上市公司实时行情数据的字典，包括代码、名称、价格、成交量等
     """
-    result = ak.stock_zh_ah_spot()
-    if type(result) is pandas.core.frame.DataFrame:
-        result = result[:min(MAX_DATA_ROW, len(result))]
-    return result.to_dict(orient="records")
+    result = _cached_call("stock_zh_ah_spot")
+    return _budgeted(result)
 
 # 工具函数：科创板实时行情数据
 @mcp.tool()
+@_guarded(cost="light", cached=lambda args: [("stock_zh_kcb_spot", SNAPSHOT_TTL, {})])
 def stock_zh_kcb_spot() -> dict:
     """获取科创板实时行情数据
     
     数据来源: 新浪财经-科创板
     网址: http://vip.stock.finance.sina.com.cn/mkt/#kcb
+    说明: 完整快照缓存SNAPSHOT_TTL(60)秒，返回数据可能比实时行情延迟最多1分钟
     
     Returns:
         dict: 包含所有科创板上市公司实时行情数据的字典，包括代码、价格、成交量、市值等
     """
-    result = ak.stock_zh_kcb_spot()
-    if type(result) is pandas.core.frame.DataFrame:
-        result = result[:min(MAX_DATA_ROW, len(result))]
-    return result.to_dict(orient="records")
+    result = _cached_call("stock_zh_kcb_spot")
+    return _budgeted(result)
 
 # 工具函数：美股实时行情数据
 @mcp.tool()
+@_guarded(cost="light", cached=lambda args: [("stock_us_spot_em", SNAPSHOT_TTL, {})])
 def stock_us_spot_em() -> dict:
     """获取美股实时行情数据
     
     数据来源: 东方财富网-美股
     网址: https://quote.eastmoney.com/center/gridlist.html#us_stocks
+    说明: 完整快照缓存SNAPSHOT_TTL(60)秒，返回数据可能比实时行情延迟最多1分钟
     
     Returns:
         dict: 包含所有美股上市公司实时行情数据的字典，包括代码、价格、成交量、市值等
     """
-    result = ak.stock_us_spot_em()
-    if type(result) is pandas.core.frame.DataFrame:
-        result = result[:min(MAX_DATA_ROW, len(result))]
-    return result.to_dict(orient="records")
+    result = _cached_call("stock_us_spot_em")
+    return _budgeted(result)
+
+# ==================== 选股筛选工具 ====================
+
+# 可供筛选的全市场快照接口
+SCREENER_SOURCES = {
+    "stock_zh_a_st_em": "风险警示板",
+    "stock_zh_a_new_em": "新股",
+    "stock_zh_kcb_spot": "科创板",
+    "stock_zh_ah_spot": "A+H股",
+    "stock_us_spot_em": "美股",
+}
+
+_SCREENER_NUMERIC_OPS = {
+    ">": operator.gt,
+    ">=": operator.ge,
+    "<": operator.lt,
+    "<=": operator.le,
+    "==": operator.eq,
+    "!=": operator.ne,
+}
+
+
+def _screener_mask(df: pandas.DataFrame, condition: dict) -> numpy.ndarray:
+    """根据单个筛选条件生成布尔掩码"""
+    column = condition.get("column")
+    op = condition.get("op", "==")
+    value = condition.get("value")
+    if column not in df.columns:
+        raise ValueError(f"筛选列不存在: {column}")
+    series = df[column]
+    if op in ("in", "not in"):
+        values = value if isinstance(value, (list, tuple)) else [value]
+        mask = series.isin(values).to_numpy()
+        return ~mask if op == "not in" else mask
+    if op == "contains":
+        return series.astype(str).str.contains(str(value), regex=False).to_numpy()
+    if op not in _SCREENER_NUMERIC_OPS:
+        raise ValueError(f"不支持的筛选运算符: {op}")
+    if isinstance(value, str) and op in ("==", "!="):
+        return _SCREENER_NUMERIC_OPS[op](series.astype(str).to_numpy(), value)
+    # 数值比较：无法转换为数值的单元格视为NaN，与任何值比较均为False
+    numbers = pandas.to_numeric(series, errors="coerce").to_numpy(dtype=float)
+    return _SCREENER_NUMERIC_OPS[op](numbers, float(value))
+
+
+# 工具函数：全市场快照筛选排序
+@mcp.tool()
+@_guarded(cost="light", budget_params=("max_bytes",),
+          cached=lambda args: [(args["source"], SNAPSHOT_TTL, {})] if args["source"] in SCREENER_SOURCES else [])
+def stock_screener(source: str, filters: list[dict] | None = None, sort_by: str = "",
+                   ascending: bool = False, top_k: int = 20,
+                   columns: list[str] | None = None) -> dict:
+    """在缓存的全市场行情快照上进行筛选、排序并取前N条
+
+    数据来源: 与对应行情工具相同，完整快照缓存SNAPSHOT_TTL秒
+
+    Args:
+        source: 快照接口名，可选值:
+               "stock_zh_a_st_em"(风险警示板),
+               "stock_zh_a_new_em"(新股),
+               "stock_zh_kcb_spot"(科创板),
+               "stock_zh_ah_spot"(A+H股),
+               "stock_us_spot_em"(美股)
+        filters: 筛选条件列表，各条件之间为"且"关系，
+                 如[{"column": "涨跌幅", "op": ">", "value": 5}]，
+                 op可选值: ">", ">=", "<", "<=", "==", "!=", "in", "not in", "contains"
+        sort_by: 排序列名，如"成交额"，数值列按数值排序，非数值列按原值排序，为空时按原始顺序返回
+        ascending: 是否升序排列，默认False(降序)
+        top_k: 返回的最大行数，超出max_bytes预算时按预算减少返回行数
+        columns: 返回的列名列表，为空时返回全部列
+
+    Returns:
+        dict: 包含快照获取时间、快照总行数、符合条件的行数、实际返回行数以及排序后前N条记录的字典，
+            因预算减少返回行数时truncated为true
+    """
+    if source not in SCREENER_SOURCES:
+        raise ValueError(f"不支持的数据源: {source}，可选值: {', '.join(SCREENER_SOURCES)}")
+    df = _cached_call(source)
+    top_k = max(1, top_k)
+
+    mask = numpy.ones(len(df), dtype=bool)
+    for condition in filters or []:
+        mask &= _screener_mask(df, condition)
+    positions = numpy.flatnonzero(mask)
+
+    if sort_by:
+        if sort_by not in df.columns:
+            raise ValueError(f"排序列不存在: {sort_by}")
+        positions = positions[_ranked_positions(df[sort_by].iloc[positions], top_k, ascending)]
+    else:
+        positions = positions[:top_k]
+
+    result = df.iloc[positions]
+    if columns:
+        missing = [column for column in columns if column not in df.columns]
+        if missing:
+            raise ValueError(f"返回列不存在: {', '.join(missing)}")
+        result = result[columns]
+
+    # 按响应字节预算确定实际返回的行数
+    max_bytes, _ = _response_budget.get()
+    response = {
+        "source": source,
+        "snapshot_time": _cached_at(source),
+        "total_rows": len(df),
+        "matched_rows": int(mask.sum()),
+        "truncated": False,
+        "returned_rows": 0,
+        "records": [],
+    }
+    k = len(result)
+    if k:
+        sample = numpy.unique(numpy.linspace(0, k - 1, num=min(k, ROW_SIZE_SAMPLES)).astype(int))
+        row_bytes = max(1.0, _json_bytes(result.iloc[sample].to_dict(orient="records")) / len(sample))
+        k = min(k, max(0, int((max_bytes - _json_bytes(response)) // row_bytes)))
+    while True:
+        response["truncated"] = k < len(result)
+        response["returned_rows"] = k
+        response["records"] = result.iloc[:k].to_dict(orient="records")
+        size = _json_bytes(response)
+        if size <= max_bytes:
+            return response
+        if k == 0:
+            raise ValueError(f"max_bytes过小，至少需要{size}字节")
+        k = int(k * max_bytes / size)
 
 # ==================== 期货市场相关工具函数 ====================
 
 # 工具函数：期货实时行情数据
 @mcp.tool()
+@_guarded
 def futures_zh_spot(symbol: str, market: str = "CF", adjust: str = "0") -> dict:
     """获取期货实时行情数据
     
@@ -539,12 +1174,12 @@ def futures_zh_spot(symbol: str, market: str = "CF", adjust: str = "0") -> dict:
         dict: 包含期货实时行情数据的字典，包括开盘价、最高价、最低价、现价、成交量等
     """
     result = ak.futures_zh_spot(symbol=symbol, market=market, adjust=adjust)
-    if type(result) is pandas.core.frame.DataFrame:
-        result = result[:min(MAX_DATA_ROW, len(result))]
-    return result.to_dict(orient="records")
+    return _budgeted(result)
 
 # 工具函数：期货主力合约匹配
 @mcp.tool()
+@_guarded(cost="light", budget_params=(),
+          cached=lambda args: [("match_main_contract", CONTRACT_INFO_TTL, {"symbol": args["symbol"]})])
 def match_main_contract(symbol: str) -> str:
     """获取期货主力合约代码
     
@@ -561,11 +1196,12 @@ def match_main_contract(symbol: str) -> str:
     Returns:
         str: 主力合约代码字符串，多个合约用逗号分隔
     """
-    result = ak.match_main_contract(symbol=symbol)
+    result = _cached_call("match_main_contract", ttl=CONTRACT_INFO_TTL, symbol=symbol)
     return {"main_contracts": result}
 
 # 工具函数：期货交易费用参照表
 @mcp.tool()
+@_guarded(cost="light", cached=lambda args: [("futures_fees_info", FEE_TABLE_TTL, {})])
 def futures_fees_info() -> dict:
     """获取期货交易费用参照表
     
@@ -575,13 +1211,12 @@ def futures_fees_info() -> dict:
     Returns:
         dict: 包含期货交易费用数据的字典，包括交易所、合约代码、手续费等信息
     """
-    result = ak.futures_fees_info()
-    if type(result) is pandas.core.frame.DataFrame:
-        result = result[:min(MAX_DATA_ROW, len(result))]
-    return result.to_dict(orient="records")
+    result = _cached_call("futures_fees_info", ttl=FEE_TABLE_TTL)
+    return _budgeted(result)
 
 # 工具函数：期货手续费与保证金
 @mcp.tool()
+@_guarded(cost="light", cached=lambda args: [("futures_comm_info", FEE_TABLE_TTL, {"symbol": args["symbol"]})])
 def futures_comm_info(symbol: str = "所有") -> dict:
     """获取期货手续费与保证金数据
     
@@ -594,13 +1229,210 @@ def futures_comm_info(symbol: str = "所有") -> dict:
     Returns:
         dict: 包含期货手续费与保证金数据的字典，包括交易所名称、合约名称、手续费等
     """
-    result = ak.futures_comm_info(symbol=symbol)
-    if type(result) is pandas.core.frame.DataFrame:
-        result = result[:min(MAX_DATA_ROW, len(result))]
-    return result.to_dict(orient="records")
+    result = _cached_call("futures_comm_info", ttl=FEE_TABLE_TTL, symbol=symbol)
+    return _budgeted(result)
+
+# openctp费用表列名 -> 合并费用表列名
+_FEES_INFO_COLUMNS = {
+    "交易所": "交易所",
+    "合约名称": "合约名称",
+    "合约乘数": "合约乘数",
+    "开仓费率（按金额）": "开仓费率",
+    "开仓费用（按手）": "开仓费用",
+    "平仓费率（按金额）": "平仓费率",
+    "平仓费用（按手）": "平仓费用",
+    "平今费率（按金额）": "平今费率",
+    "平今费用（按手）": "平今费用",
+    "做多保证金率（按金额）": "做多保证金率",
+    "做多保证金（按手）": "做多保证金",
+    "做空保证金率（按金额）": "做空保证金率",
+    "做空保证金（按手）": "做空保证金",
+    "最新价": "最新价",
+}
+
+# 九期网交易所名称 -> openctp交易所代码
+_EXCHANGE_CODES = {
+    "上海期货交易所": "SHFE",
+    "大连商品交易所": "DCE",
+    "郑州商品交易所": "CZCE",
+    "上海国际能源交易中心": "INE",
+    "广州期货交易所": "GFEX",
+    "中国金融期货交易所": "CFFEX",
+}
+
+# 订单开平类型 -> (费率列, 按手费用列)
+_ORDER_OFFSET_FEES = {
+    "open": ("开仓费率", "开仓费用"),
+    "close": ("平仓费率", "平仓费用"),
+    "close_today": ("平今费率", "平今费用"),
+}
+
+_fee_table = None
+_fee_table_sources = (None, None)
+_fee_table_lock = threading.Lock()
+
+
+def _numeric_column(df: pandas.DataFrame, column: str) -> pandas.Series:
+    """按列名取数值列，列不存在或无法解析的单元格记为NaN"""
+    if column not in df.columns:
+        return pandas.Series(numpy.nan, index=df.index)
+    return pandas.to_numeric(df[column], errors="coerce").astype(float)
+
+
+def _contract_keys(codes: pandas.Series) -> pandas.Series:
+    """统一合约代码写法，作为合并费用表的索引"""
+    return codes.astype(str).str.strip().str.upper()
+
+
+def _build_fee_table(fees: pandas.DataFrame, comm: pandas.DataFrame) -> pandas.DataFrame:
+    """合并openctp与九期网数据，得到按合约代码索引的手续费与保证金表
+
+    两个数据源同时存在的字段以openctp为准，缺失部分由九期网补齐。
+    """
+    ctp = pandas.DataFrame(index=_contract_keys(fees["合约代码"]))
+    for source, target in _FEES_INFO_COLUMNS.items():
+        if target in ("交易所", "合约名称"):
+            ctp[target] = fees[source].to_numpy() if source in fees.columns else None
+        else:
+            ctp[target] = _numeric_column(fees, source).to_numpy()
+    ctp = ctp[~ctp.index.duplicated(keep="last")]
+
+    qihuo = pandas.DataFrame(index=_contract_keys(comm["合约代码"]))
+    exchanges = comm["交易所名称"].astype(str)
+    qihuo["交易所"] = exchanges.map(_EXCHANGE_CODES).fillna(exchanges).to_numpy()
+    qihuo["合约名称"] = comm["合约名称"].to_numpy()
+    price = _numeric_column(comm, "现价").to_numpy()
+    long_rate = _numeric_column(comm, "保证金-买开").to_numpy() / 100
+    short_rate = _numeric_column(comm, "保证金-卖开").to_numpy() / 100
+    # 九期网不提供合约乘数，由每手保证金反推
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        multiplier = numpy.round(_numeric_column(comm, "保证金-每手").to_numpy() / (price * long_rate))
+    qihuo["合约乘数"] = numpy.where(numpy.isfinite(multiplier) & (multiplier > 0), multiplier, numpy.nan)
+    qihuo["开仓费率"] = _numeric_column(comm, "手续费标准-开仓-万分之").to_numpy()
+    qihuo["开仓费用"] = _numeric_column(comm, "手续费标准-开仓-元").to_numpy()
+    qihuo["平仓费率"] = _numeric_column(comm, "手续费标准-平昨-万分之").to_numpy()
+    qihuo["平仓费用"] = _numeric_column(comm, "手续费标准-平昨-元").to_numpy()
+    qihuo["平今费率"] = _numeric_column(comm, "手续费标准-平今-万分之").to_numpy()
+    qihuo["平今费用"] = _numeric_column(comm, "手续费标准-平今-元").to_numpy()
+    qihuo["做多保证金率"] = long_rate
+    qihuo["做多保证金"] = 0.0
+    qihuo["做空保证金率"] = short_rate
+    qihuo["做空保证金"] = 0.0
+    qihuo["最新价"] = price
+    qihuo = qihuo[~qihuo.index.duplicated(keep="last")]
+
+    table = ctp.combine_first(qihuo)[list(ctp.columns)]
+    in_ctp = table.index.isin(ctp.index)
+    in_qihuo = table.index.isin(qihuo.index)
+    table["数据来源"] = numpy.select(
+        [in_ctp & in_qihuo, in_ctp], ["openctp+9qihuo", "openctp"], default="9qihuo"
+    )
+    table.index.name = "合约代码"
+    return table
+
+
+def _futures_fee_table() -> pandas.DataFrame:
+    """获取合并后的期货费用表，两个数据源任一刷新后重新合并"""
+    global _fee_table, _fee_table_sources
+    fees = _cached_call("futures_fees_info", ttl=FEE_TABLE_TTL)
+    comm = _cached_call("futures_comm_info", ttl=FEE_TABLE_TTL, symbol="所有")
+    with _fee_table_lock:
+        if _fee_table_sources[0] is not fees or _fee_table_sources[1] is not comm:
+            _fee_table = _build_fee_table(fees, comm)
+            _fee_table_sources = (fees, comm)
+        return _fee_table
+
+
+# 工具函数：期货订单手续费与保证金试算
+@mcp.tool()
+@_guarded(cost="light", cached=lambda args: [("futures_fees_info", FEE_TABLE_TTL, {}),
+                                              ("futures_comm_info", FEE_TABLE_TTL, {"symbol": "所有"})])
+def futures_order_cost(orders: list[dict]) -> dict:
+    """批量试算期货订单的手续费与保证金
+
+    数据来源: openctp 期货交易费用参照表与九期网-期货手续费数据合并，每日更新
+
+    Args:
+        orders: 订单列表，如[{"contract": "cu2508", "price": 78000, "lots": 2, "offset": "open", "direction": "long"}]
+                contract: 合约代码，不区分大小写
+                price: 成交价格，必填，须大于0
+                lots: 手数，必填，须大于0
+                offset: 开平类型，可选值: "open"(开仓，默认), "close"(平昨), "close_today"(平今)
+                direction: 方向，可选值: "long"(做多，默认), "short"(做空)，仅用于计算开仓保证金
+
+    Returns:
+        dict: 包含每笔订单的合约乘数、手续费、占用保证金以及合计的字典，未找到的合约费用为空，
+            已找到但缺少合约乘数等数据、无法计算的费用也为空，并列在"费用不完整合约"中；
+            订单较多超出max_bytes时orders按数据限制规则截断，合计仍按全部订单计算
+    """
+    if not orders:
+        raise ValueError("订单列表不能为空")
+    frame = pandas.DataFrame(orders)
+    if "contract" not in frame.columns:
+        raise ValueError("订单缺少contract字段")
+    price = _numeric_column(frame, "price").to_numpy()
+    lots = _numeric_column(frame, "lots").to_numpy()
+    invalid = numpy.flatnonzero(~(numpy.isfinite(price) & (price > 0) & numpy.isfinite(lots) & (lots > 0)))
+    if len(invalid):
+        described = ", ".join(f"第{position + 1}笔({frame['contract'].iloc[position]})" for position in invalid)
+        raise ValueError(f"订单的price与lots必须为大于0的数值: {described}")
+    offsets = frame.get("offset", pandas.Series("open", index=frame.index)).fillna("open")
+    directions = frame.get("direction", pandas.Series("long", index=frame.index)).fillna("long")
+    unknown = set(offsets) - set(_ORDER_OFFSET_FEES)
+    if unknown:
+        raise ValueError(f"不支持的开平类型: {', '.join(map(str, unknown))}")
+    unknown = set(directions) - {"long", "short"}
+    if unknown:
+        raise ValueError(f"不支持的方向: {', '.join(map(str, unknown))}")
+
+    matched = _futures_fee_table().reindex(_contract_keys(frame["contract"]))
+    multiplier = matched["合约乘数"].to_numpy()
+    notional = price * lots * multiplier
+
+    offset_values = offsets.to_numpy()
+    rate = numpy.full(len(frame), numpy.nan)
+    per_lot = numpy.full(len(frame), numpy.nan)
+    for offset, (rate_column, per_lot_column) in _ORDER_OFFSET_FEES.items():
+        selected = offset_values == offset
+        rate[selected] = matched[rate_column].to_numpy()[selected]
+        per_lot[selected] = matched[per_lot_column].to_numpy()[selected]
+    # 费率与按手费用只要有一项已知，另一项按0计算；费率非0但缺少合约乘数时无法计算，费用为空
+    rate_fee = numpy.where(numpy.isnan(rate) | (rate == 0), 0.0, notional * rate)
+    fee = rate_fee + numpy.nan_to_num(lots * per_lot)
+    fee = numpy.where(numpy.isnan(rate) & numpy.isnan(per_lot), numpy.nan, fee)
+
+    is_long = directions.to_numpy() == "long"
+    margin_rate = numpy.where(is_long, matched["做多保证金率"].to_numpy(), matched["做空保证金率"].to_numpy())
+    margin_per_lot = numpy.where(is_long, matched["做多保证金"].to_numpy(), matched["做空保证金"].to_numpy())
+    margin = notional * margin_rate + lots * numpy.nan_to_num(margin_per_lot)
+    margin = numpy.where(offset_values == "open", margin, 0.0)
+
+    result = pandas.DataFrame({
+        "contract": frame["contract"].to_numpy(),
+        "price": price,
+        "lots": lots,
+        "offset": offset_values,
+        "direction": directions.to_numpy(),
+        "交易所": matched["交易所"].to_numpy(),
+        "合约乘数": multiplier,
+        "手续费": fee,
+        "保证金": margin,
+        "数据来源": matched["数据来源"].to_numpy(),
+    })
+    unmatched = matched["数据来源"].isna().to_numpy()
+    return {
+        # 未匹配合约的费用字段返回null，而不是JSON无法表示的NaN
+        "orders": _budgeted(result, null_missing=True),
+        "手续费合计": float(numpy.nansum(fee)),
+        "保证金合计": float(numpy.nansum(margin)),
+        "未匹配合约": frame["contract"][unmatched].tolist(),
+        # 已匹配但数据不足、未计入合计的订单合约
+        "费用不完整合约": frame["contract"][~unmatched & (numpy.isnan(fee) | numpy.isnan(margin))].tolist(),
+    }
 
 # 工具函数：期货规则-交易日历表
 @mcp.tool()
+@_guarded
 def futures_rule(date: str) -> dict:
     """获取期货规则-交易日历表数据
     
@@ -614,12 +1446,11 @@ def futures_rule(date: str) -> dict:
         dict: 包含指定交易日所有合约的交易日历数据的字典
     """
     result = ak.futures_rule(date=date)
-    if type(result) is pandas.core.frame.DataFrame:
-        result = result[:min(MAX_DATA_ROW, len(result))]
-    return result.to_dict(orient="records")
+    return _budgeted(result)
 
 # 工具函数：期货现期图数据
 @mcp.tool()
+@_guarded
 def futures_spot_sys(symbol: str, indicator: str) -> dict:
     """获取期货现期图数据
     
@@ -634,12 +1465,11 @@ def futures_spot_sys(symbol: str, indicator: str) -> dict:
         dict: 包含现期图数据的字典，根据指标类型返回相应数据
     """
     result = ak.futures_spot_sys(symbol=symbol, indicator=indicator)
-    if type(result) is pandas.core.frame.DataFrame:
-        result = result[:min(MAX_DATA_ROW, len(result))]
-    return result.to_dict(orient="records")
+    return _budgeted(result)
 
 # 工具函数：上海期货交易所合约信息
 @mcp.tool()
+@_guarded
 def futures_contract_info_shfe(date: str) -> dict:
     """获取上海期货交易所合约信息
     
@@ -652,13 +1482,12 @@ def futures_contract_info_shfe(date: str) -> dict:
     Returns:
         dict: 包含上海期货交易所合约信息数据的字典
     """
-    result = ak.futures_contract_info_shfe(date=date)
-    if type(result) is pandas.core.frame.DataFrame:
-        result = result[:min(MAX_DATA_ROW, len(result))]
-    return result.to_dict(orient="records")
+    result = _cached_call("futures_contract_info_shfe", ttl=CONTRACT_INFO_TTL, date=date)
+    return _budgeted(result)
 
 # 工具函数：大连商品交易所合约信息
 @mcp.tool()
+@_guarded
 def futures_contract_info_dce() -> dict:
     """获取大连商品交易所合约信息
     
@@ -668,13 +1497,12 @@ def futures_contract_info_dce() -> dict:
     Returns:
         dict: 包含大连商品交易所最近交易日的期货合约信息数据的字典
     """
-    result = ak.futures_contract_info_dce()
-    if type(result) is pandas.core.frame.DataFrame:
-        result = result[:min(MAX_DATA_ROW, len(result))]
-    return result.to_dict(orient="records")
+    result = _cached_call("futures_contract_info_dce", ttl=CONTRACT_INFO_TTL)
+    return _budgeted(result)
 
 # 工具函数：郑州商品交易所合约信息
 @mcp.tool()
+@_guarded
 def futures_contract_info_czce(date: str) -> dict:
     """获取郑州商品交易所合约信息
     
@@ -687,13 +1515,12 @@ def futures_contract_info_czce(date: str) -> dict:
     Returns:
         dict: 包含郑州商品交易所合约信息数据的字典
     """
-    result = ak.futures_contract_info_czce(date=date)
-    if type(result) is pandas.core.frame.DataFrame:
-        result = result[:min(MAX_DATA_ROW, len(result))]
-    return result.to_dict(orient="records")
+    result = _cached_call("futures_contract_info_czce", ttl=CONTRACT_INFO_TTL, date=date)
+    return _budgeted(result)
 
 # 工具函数：中国金融期货交易所合约信息
 @mcp.tool()
+@_guarded
 def futures_contract_info_cffex(date: str) -> dict:
     """获取中国金融期货交易所合约信息
     
@@ -706,13 +1533,12 @@ def futures_contract_info_cffex(date: str) -> dict:
     Returns:
         dict: 包含中国金融期货交易所合约信息数据的字典
     """
-    result = ak.futures_contract_info_cffex(date=date)
-    if type(result) is pandas.core.frame.DataFrame:
-        result = result[:min(MAX_DATA_ROW, len(result))]
-    return result.to_dict(orient="records")
+    result = _cached_call("futures_contract_info_cffex", ttl=CONTRACT_INFO_TTL, date=date)
+    return _budgeted(result)
 
 # 工具函数：外盘期货品种代码表
 @mcp.tool()
+@_guarded
 def futures_hq_subscribe_exchange_symbol() -> dict:
     """获取外盘期货品种代码表
     
@@ -723,12 +1549,11 @@ def futures_hq_subscribe_exchange_symbol() -> dict:
         dict: 包含外盘期货品种代码表数据的字典
     """
     result = ak.futures_hq_subscribe_exchange_symbol()
-    if type(result) is pandas.core.frame.DataFrame:
-        result = result[:min(MAX_DATA_ROW, len(result))]
-    return result.to_dict(orient="records")
+    return _budgeted(result)
 
 # 工具函数：外盘期货实时行情数据
 @mcp.tool()
+@_guarded
 def futures_foreign_commodity_realtime(symbol: str) -> dict:
     """获取外盘期货实时行情数据
     
@@ -742,12 +1567,11 @@ def futures_foreign_commodity_realtime(symbol: str) -> dict:
         dict: 包含外盘期货实时行情数据的字典
     """
     result = ak.futures_foreign_commodity_realtime(symbol=symbol)
-    if type(result) is pandas.core.frame.DataFrame:
-        result = result[:min(MAX_DATA_ROW, len(result))]
-    return result.to_dict(orient="records")
+    return _budgeted(result)
 
 # 工具函数：国际期货实时行情数据-东财
 @mcp.tool()
+@_guarded(cost="heavy")
 def futures_global_spot_em() -> dict:
     """获取国际期货实时行情数据
     
@@ -758,12 +1582,11 @@ def futures_global_spot_em() -> dict:
         dict: 包含所有国际期货品种的实时行情数据的字典
     """
     result = ak.futures_global_spot_em()
-    if type(result) is pandas.core.frame.DataFrame:
-        result = result[:min(MAX_DATA_ROW, len(result))]
-    return result.to_dict(orient="records")
+    return _budgeted(result)
 
 # 工具函数：期货资讯-上海金属网快讯
 @mcp.tool()
+@_guarded
 def futures_news_shmet(symbol: str) -> dict:
     """获取期货资讯-上海金属网快讯
     
@@ -777,9 +1600,7 @@ def futures_news_shmet(symbol: str) -> dict:
         dict: 包含期货资讯快讯数据的字典，包括发布时间、内容等
     """
     result = ak.futures_news_shmet(symbol=symbol)
-    if type(result) is pandas.core.frame.DataFrame:
-        result = result[:min(MAX_DATA_ROW, len(result))]
-    return result.to_dict(orient="records")
+    return _budgeted(result)
 
 def main():
     """启动MCP服务器"""
@@ -0,0 +1,48 @@
+import json
+
+import numpy
+import pandas
+import pytest
+
+import main
+
+
+def _with_budget(max_bytes, func, *args, **kwargs):
+    token = main._response_budget.set((max_bytes, ""))
+    try:
+        return func(*args, **kwargs)
+    finally:
+        main._response_budget.reset(token)
+
+
+def test_small_budget_shrinks_summary():
+    df = pandas.DataFrame(numpy.random.rand(5000, 7), columns=[f"c{i}" for i in range(7)])
+    for max_bytes in (200, 400, 2000):
+        response = _with_budget(max_bytes, main._budgeted, df)
+        assert main._json_bytes(response) <= max_bytes
+        assert response["total_rows"] == 5000
+
+
+def test_budget_below_envelope_is_rejected():
+    df = pandas.DataFrame(numpy.random.rand(100, 3))
+    with pytest.raises(ValueError):
+        _with_budget(50, main._budgeted, df)
+
+
+def test_null_missing_records():
+    df = pandas.DataFrame({"合约": ["a", "b"], "手续费": [1.5, numpy.nan]})
+    records = _with_budget(main.DEFAULT_MAX_BYTES, main._budgeted, df, null_missing=True)
+    assert records[1]["手续费"] is None
+    json.dumps(records, allow_nan=False)
+
+
+def test_non_numeric_rank_by_sorts_by_value():
+    df = pandas.DataFrame({"名称": [f"股票{i:04d}" for i in range(500)], "最新价": numpy.arange(500.0)})
+    token = main._response_budget.set((2000, "名称"))
+    try:
+        response = main._budgeted(df)
+    finally:
+        main._response_budget.reset(token)
+    assert response["selection"] == "top_by:名称"
+    names = [record["名称"] for record in response["records"]]
+    assert names == [f"股票{i:04d}" for i in range(499, 499 - len(names), -1)]
@@ -0,0 +1,79 @@
+import collections
+
+import numpy
+import pandas
+import pytest
+from pandas.testing import assert_frame_equal
+
+import main
+
+
+@pytest.fixture
+def empty_cache(monkeypatch):
+    monkeypatch.setattr(main, "_snapshot_cache", collections.OrderedDict())
+    monkeypatch.setattr(main, "_snapshot_cache_bytes", 0)
+
+
+def _round_trip(df):
+    compact = main._compact_dataframe(df)
+    assert_frame_equal(compact, df, check_dtype=False, check_categorical=False)
+    return compact
+
+
+def test_integral_floats_become_integers():
+    compact = _round_trip(pandas.DataFrame({"成交量": [100.0, 2500.0, 0.0]}))
+    assert compact["成交量"].dtype.kind in "iu"
+
+
+def test_floats_with_nan_or_fractions_stay_float():
+    compact = _round_trip(pandas.DataFrame({
+        "缺失": [1.0, numpy.nan, 3.0],
+        "小数": [1.5, 2.0, 3.0],
+        "大数": [2.0 ** 60, 1.0, 2.0],
+    }))
+    assert compact["缺失"].dtype.kind == "f"
+    assert compact["小数"].dtype.kind == "f"
+    assert compact["大数"].dtype.kind == "f"
+
+
+def test_float32_only_on_exact_round_trip():
+    compact = _round_trip(pandas.DataFrame({"精确": [0.5, 0.25, numpy.nan], "价格": [10.12, 3.33, 7.01]}))
+    assert compact["精确"].dtype == "float32"
+    assert compact["价格"].dtype == "float64"
+
+
+def test_string_columns_by_cardinality():
+    df = pandas.DataFrame({
+        "板块": ["银行", "银行", "地产", "银行"],
+        "名称": ["平安银行", "万科A", "国农科技", "国华网安"],
+        "简称": ["平安", None, "国农", "国华"],
+    })
+    compact = _round_trip(df)
+    assert isinstance(compact["板块"].dtype, pandas.CategoricalDtype)
+    assert not isinstance(compact["名称"].dtype, pandas.CategoricalDtype)
+    if main._STRING_DTYPE is not None:
+        assert compact["名称"].dtype == main._STRING_DTYPE
+    # 缺失值保持为None，序列化结果不变
+    assert compact["简称"].dtype == object
+    assert compact.to_dict(orient="records") == df.to_dict(orient="records")
+
+
+def test_mixed_object_columns_unchanged():
+    compact = _round_trip(pandas.DataFrame({"涨跌幅": [1.2, "-", 3.4]}))
+    assert compact["涨跌幅"].dtype == object
+
+
+def test_least_recently_used_entry_evicted(monkeypatch, empty_cache):
+    frames = {name: pandas.DataFrame({"值": numpy.arange(1000, dtype="int64") * 1000 ** 2 + index})
+              for index, name in enumerate(["first", "second", "third"])}
+    for name, df in frames.items():
+        monkeypatch.setattr(main.ak, name, lambda df=df: df, raising=False)
+    entry_bytes = main._memory_bytes(main._compact_dataframe(frames["first"]))
+    monkeypatch.setattr(main, "CACHE_MAX_BYTES", entry_bytes * 2)
+
+    main._cached_call("first")
+    main._cached_call("second")
+    main._cached_call("first")
+    main._cached_call("third")
+    assert [key[0] for key in main._snapshot_cache] == ["first", "third"]
+    assert main._snapshot_cache_bytes == entry_bytes * 2
@@ -0,0 +1,33 @@
+import asyncio
+import collections
+import time
+
+import pandas
+
+import main
+
+
+def test_deadline_fallback_counted_in_cache(monkeypatch):
+    monkeypatch.setattr(main, "_snapshot_cache", collections.OrderedDict())
+    monkeypatch.setattr(main, "_snapshot_cache_bytes", 0)
+    delay = [0.0]
+
+    def stock_sse_summary():
+        time.sleep(delay[0])
+        return pandas.DataFrame({"项目": ["流通股本", "总市值"], "股票": [4.0, 5.5]})
+
+    monkeypatch.setattr(main.ak, "stock_sse_summary", stock_sse_summary)
+
+    async def scenario():
+        first = await main.stock_sse_summary.fn(deadline=5)
+        delay[0] = 0.5
+        second = await main.stock_sse_summary.fn(deadline=0.05)
+        # 等被放弃的调用结束、归还执行槽后再关闭事件循环
+        await asyncio.sleep(0.6)
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert second["deadline_exceeded"] is True
+    assert second["stale_result"] == first
+    assert [key[0] for key in main._snapshot_cache] == ["deadline_fallback"]
+    assert main._snapshot_cache_bytes == sum(entry[2] for entry in main._snapshot_cache.values()) > 0
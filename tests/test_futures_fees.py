@@ -0,0 +1,124 @@
+import collections
+
+import numpy
+import pandas
+import pytest
+
+import main
+
+order_cost = main.futures_order_cost.fn.__wrapped__
+
+
+def _fees_info():
+    return pandas.DataFrame({
+        "交易所": ["SHFE", "DCE"],
+        "合约代码": ["cu2508", "m2509"],
+        "合约名称": ["沪铜2508", "豆粕2509"],
+        "合约乘数": [5, 10],
+        "开仓费率（按金额）": [0.00005, 0.0],
+        "开仓费用（按手）": [0.0, 1.51],
+        "平仓费率（按金额）": [0.00005, 0.0],
+        "平仓费用（按手）": [0.0, 1.51],
+        "平今费率（按金额）": [0.0001, numpy.nan],
+        "平今费用（按手）": [0.0, numpy.nan],
+        "做多保证金率（按金额）": [0.1, 0.08],
+        "做多保证金（按手）": [0.0, 0.0],
+        "做空保证金率（按金额）": [0.1, 0.08],
+        "做空保证金（按手）": [0.0, 0.0],
+        "最新价": [78000.0, 3000.0],
+    })
+
+
+def _comm_info(symbol="所有"):
+    return pandas.DataFrame({
+        "交易所名称": ["大连商品交易所", "上海期货交易所", "上海期货交易所"],
+        "合约名称": ["豆粕2509", "白银2512", "黄金2512"],
+        "合约代码": ["m2509", "ag2512", "au2512"],
+        "现价": [3000.0, 7000.0, 600.0],
+        "保证金-买开": [10.0, 12.0, 8.0],
+        "保证金-卖开": [10.0, 14.0, 8.0],
+        "保证金-每手": [3000.0, 12600.0, numpy.nan],
+        "手续费标准-开仓-万分之": [numpy.nan, 0.00005, 0.00002],
+        "手续费标准-开仓-元": [2.0, numpy.nan, numpy.nan],
+        "手续费标准-平昨-万分之": [numpy.nan, 0.00005, 0.00002],
+        "手续费标准-平昨-元": [2.0, numpy.nan, numpy.nan],
+        "手续费标准-平今-万分之": [numpy.nan, 0.00005, 0.0],
+        "手续费标准-平今-元": [0.75, numpy.nan, numpy.nan],
+    })
+
+
+@pytest.fixture
+def fee_sources(monkeypatch):
+    monkeypatch.setattr(main, "_snapshot_cache", collections.OrderedDict())
+    monkeypatch.setattr(main, "_snapshot_cache_bytes", 0)
+    monkeypatch.setattr(main, "_fee_table_sources", (None, None))
+    monkeypatch.setattr(main.ak, "futures_fees_info", _fees_info)
+    monkeypatch.setattr(main.ak, "futures_comm_info", _comm_info)
+
+
+def test_openctp_takes_precedence_and_9qihuo_fills_gaps():
+    table = main._build_fee_table(_fees_info(), _comm_info())
+    assert table.loc["M2509", "开仓费用"] == 1.51
+    assert table.loc["M2509", "平今费用"] == 0.75
+    assert table.loc["M2509", "合约乘数"] == 10
+    assert table.loc["M2509", "数据来源"] == "openctp+9qihuo"
+    assert table.loc["CU2508", "数据来源"] == "openctp"
+
+
+def test_9qihuo_only_contract():
+    table = main._build_fee_table(_fees_info(), _comm_info())
+    row = table.loc["AG2512"]
+    # 每手保证金12600 / (现价7000 * 12%)
+    assert row["合约乘数"] == 15
+    assert row["做多保证金率"] == pytest.approx(0.12)
+    assert row["做空保证金率"] == pytest.approx(0.14)
+    assert row["交易所"] == "SHFE"
+    assert row["数据来源"] == "9qihuo"
+    assert numpy.isnan(table.loc["AU2512", "合约乘数"])
+
+
+def test_fee_and_margin_by_offset(fee_sources):
+    response = order_cost([
+        {"contract": "CU2508", "price": 78000, "lots": 2},
+        {"contract": "cu2508", "price": 78000, "lots": 2, "offset": "close"},
+        {"contract": "cu2508", "price": 78000, "lots": 2, "offset": "close_today", "direction": "short"},
+        {"contract": "m2509", "price": 3000, "lots": 1, "offset": "close_today"},
+        {"contract": "ag2512", "price": 7000, "lots": 1, "direction": "short"},
+    ])
+    orders = response["orders"]
+    assert [order["手续费"] for order in orders] == pytest.approx([39.0, 39.0, 78.0, 0.75, 5.25])
+    assert [order["保证金"] for order in orders] == pytest.approx([78000.0, 0.0, 0.0, 0.0, 14700.0])
+    assert response["手续费合计"] == pytest.approx(162.0)
+    assert response["保证金合计"] == pytest.approx(92700.0)
+    assert response["未匹配合约"] == []
+    assert response["费用不完整合约"] == []
+
+
+def test_unmatched_contract_returns_null(fee_sources):
+    response = order_cost([
+        {"contract": "cu2508", "price": 78000, "lots": 2},
+        {"contract": "xx9999", "price": 100, "lots": 1},
+    ])
+    assert response["orders"][1]["手续费"] is None
+    assert response["orders"][1]["保证金"] is None
+    assert response["未匹配合约"] == ["xx9999"]
+    assert response["手续费合计"] == pytest.approx(39.0)
+
+
+def test_missing_multiplier_gives_null_fee(fee_sources):
+    response = order_cost([{"contract": "au2512", "price": 600, "lots": 1}])
+    assert response["orders"][0]["手续费"] is None
+    assert response["orders"][0]["保证金"] is None
+    assert response["费用不完整合约"] == ["au2512"]
+
+
+@pytest.mark.parametrize("order", [
+    {"contract": "CU2508", "lots": 2},
+    {"contract": "CU2508", "price": "abc", "lots": 2},
+    {"contract": "CU2508", "price": 78000},
+    {"contract": "CU2508", "price": 78000, "lots": 0},
+    {"contract": "CU2508", "price": -1, "lots": 2},
+])
+def test_invalid_price_or_lots_rejected(fee_sources, order):
+    with pytest.raises(ValueError, match=r"第2笔\(CU2508\)"):
+        order_cost([{"contract": "cu2508", "price": 78000, "lots": 1}, order])
@@ -0,0 +1,101 @@
+import asyncio
+import collections
+
+import main
+
+
+def _fill(scheduler, cost, count):
+    async def admit():
+        for _ in range(count):
+            assert await scheduler.acquire(cost, None) == "admitted"
+    return admit()
+
+
+def test_heavy_admitted_while_standard_waits_on_its_own_limit():
+    async def scenario():
+        scheduler = main._Scheduler(main.TOOL_WORKERS)
+        await _fill(scheduler, "standard", main.COST_CLASSES["standard"][1])
+        queued = asyncio.ensure_future(scheduler.acquire("standard", None))
+        await asyncio.sleep(0)
+        assert not queued.done()
+
+        # 仍有空闲执行槽，heavy不应排在受并发上限限制的standard之后
+        assert await scheduler.acquire("heavy", 0.1) == "admitted"
+
+        scheduler.release("standard")
+        assert await queued == "admitted"
+
+    asyncio.run(scenario())
+
+
+def test_release_skips_capped_class():
+    async def scenario():
+        scheduler = main._Scheduler(main.TOOL_WORKERS)
+        await _fill(scheduler, "standard", main.COST_CLASSES["standard"][1])
+        await _fill(scheduler, "heavy", main.TOOL_WORKERS - main.COST_CLASSES["standard"][1])
+        standard = asyncio.ensure_future(scheduler.acquire("standard", None))
+        heavy = asyncio.ensure_future(scheduler.acquire("heavy", None))
+        await asyncio.sleep(0)
+        assert not standard.done() and not heavy.done()
+
+        # 释放heavy执行槽：standard仍受自身上限限制，执行槽应分配给heavy
+        scheduler.release("heavy")
+        assert await heavy == "admitted"
+        assert not standard.done()
+        standard.cancel()
+
+    asyncio.run(scenario())
+
+
+def test_higher_priority_waiter_served_first_when_capacity_full():
+    async def scenario():
+        scheduler = main._Scheduler(main.TOOL_WORKERS)
+        await _fill(scheduler, "standard", main.COST_CLASSES["standard"][1])
+        await _fill(scheduler, "heavy", main.TOOL_WORKERS - main.COST_CLASSES["standard"][1])
+        heavy = asyncio.ensure_future(scheduler.acquire("heavy", None))
+        await asyncio.sleep(0)
+        light = asyncio.ensure_future(scheduler.acquire("light", None))
+        await asyncio.sleep(0)
+
+        scheduler.release("heavy")
+        assert await light == "admitted"
+        assert not heavy.done()
+        heavy.cancel()
+
+    asyncio.run(scenario())
+
+
+def test_full_queue_is_rejected_as_busy():
+    async def scenario():
+        scheduler = main._Scheduler(main.TOOL_WORKERS)
+        limit, queue_limit = main.COST_CLASSES["heavy"][1:3]
+        await _fill(scheduler, "heavy", limit)
+        waiters = [asyncio.ensure_future(scheduler.acquire("heavy", None)) for _ in range(queue_limit)]
+        await asyncio.sleep(0)
+        assert await scheduler.acquire("heavy", None) == "busy"
+        for waiter in waiters:
+            waiter.cancel()
+
+    asyncio.run(scenario())
+
+
+def test_cost_class_follows_cache_state(monkeypatch):
+    seen = []
+    original_acquire = main._Scheduler.acquire
+
+    async def recording_acquire(self, cost, timeout):
+        seen.append(cost)
+        return await original_acquire(self, cost, timeout)
+
+    monkeypatch.setattr(main._Scheduler, "acquire", recording_acquire)
+    monkeypatch.setattr(main.ak, "match_main_contract", lambda symbol: f"{symbol}-main")
+    monkeypatch.setattr(main, "_snapshot_cache", collections.OrderedDict())
+    monkeypatch.setattr(main, "_snapshot_cache_bytes", 0)
+
+    async def scenario():
+        tool = (await main.mcp.get_tools())["match_main_contract"]
+        await tool.run({"symbol": "dce"})
+        await tool.run({"symbol": "dce"})
+
+    asyncio.run(scenario())
+    assert seen == ["heavy", "light"]
@@ -0,0 +1,102 @@
+import numpy
+import pandas
+import pytest
+
+import main
+
+screener = main.stock_screener.fn.__wrapped__
+
+
+@pytest.fixture
+def snapshot(monkeypatch):
+    df = pandas.DataFrame({
+        "代码": ["000001", "000002", "000003", "000004", "000005"],
+        "名称": ["平安银行", "万科A", "国农科技", "国华网安", "世纪星源"],
+        "最新价": [10.5, 8.2, numpy.nan, 15.0, 2.1],
+        "涨跌幅": [1.2, -3.5, 0.0, 6.8, "-"],
+    })
+    monkeypatch.setattr(main, "_cached_call", lambda func_name, **kwargs: df)
+    return df
+
+
+def _codes(response):
+    return [record["代码"] for record in response["records"]]
+
+
+def test_numeric_filters(snapshot):
+    response = screener("stock_us_spot_em", filters=[{"column": "涨跌幅", "op": ">", "value": 0}])
+    assert _codes(response) == ["000001", "000004"]
+    assert response["matched_rows"] == 2
+    assert response["total_rows"] == 5
+    response = screener("stock_us_spot_em", filters=[{"column": "最新价", "op": "<=", "value": 8.2},
+                                                     {"column": "涨跌幅", "op": "!=", "value": 0}])
+    assert _codes(response) == ["000002", "000005"]
+
+
+def test_set_and_text_filters(snapshot):
+    response = screener("stock_us_spot_em", filters=[{"column": "代码", "op": "in", "value": ["000002", "000005"]}])
+    assert _codes(response) == ["000002", "000005"]
+    response = screener("stock_us_spot_em", filters=[{"column": "代码", "op": "not in", "value": "000001"}])
+    assert _codes(response) == ["000002", "000003", "000004", "000005"]
+    response = screener("stock_us_spot_em", filters=[{"column": "名称", "op": "contains", "value": "国"}])
+    assert _codes(response) == ["000003", "000004"]
+    response = screener("stock_us_spot_em", filters=[{"column": "名称", "op": "==", "value": "万科A"}])
+    assert _codes(response) == ["000002"]
+
+
+def test_invalid_filters_are_rejected(snapshot):
+    with pytest.raises(ValueError):
+        screener("stock_us_spot_em", filters=[{"column": "不存在", "op": ">", "value": 1}])
+    with pytest.raises(ValueError):
+        screener("stock_us_spot_em", filters=[{"column": "最新价", "op": "~", "value": 1}])
+    with pytest.raises(ValueError):
+        screener("stock_zh_a_spot_em")
+
+
+def test_missing_values_sort_last(snapshot):
+    assert _codes(screener("stock_us_spot_em", sort_by="最新价")) == ["000004", "000001", "000002", "000005", "000003"]
+    assert _codes(screener("stock_us_spot_em", sort_by="最新价", ascending=True, top_k=4)) == [
+        "000005", "000002", "000001", "000004"]
+
+
+def test_top_k_positions_keeps_nan_last():
+    values = numpy.array([3.0, numpy.nan, 1.0, 2.0, numpy.nan])
+    assert main._top_k_positions(values, 4, ascending=True).tolist() == [2, 3, 0, 1]
+    assert main._top_k_positions(values, 2, ascending=False).tolist() == [0, 3]
+
+
+def test_non_numeric_sort_by_sorts_by_value(snapshot):
+    response = screener("stock_us_spot_em", sort_by="名称", ascending=True)
+    assert [record["名称"] for record in response["records"]] == sorted(snapshot["名称"])
+    response = screener("stock_us_spot_em", sort_by="名称", top_k=2)
+    assert [record["名称"] for record in response["records"]] == sorted(snapshot["名称"], reverse=True)[:2]
+
+
+def test_columns_projection(snapshot):
+    response = screener("stock_us_spot_em", sort_by="涨跌幅", top_k=1, columns=["代码", "涨跌幅"])
+    assert response["records"] == [{"代码": "000004", "涨跌幅": 6.8}]
+    with pytest.raises(ValueError):
+        screener("stock_us_spot_em", columns=["代码", "不存在"])
+
+
+def test_rows_limited_by_byte_budget(monkeypatch):
+    df = pandas.DataFrame({f"列{i}": numpy.arange(1000.0) + i / 8 for i in range(20)})
+    monkeypatch.setattr(main, "_cached_call", lambda func_name, **kwargs: df)
+    token = main._response_budget.set((4096, ""))
+    try:
+        response = screener("stock_us_spot_em", sort_by="列0", top_k=500)
+        assert main._json_bytes(response) <= 4096
+        assert response["truncated"] is True
+        assert 0 < response["returned_rows"] == len(response["records"]) < 500
+        assert response["records"][0]["列0"] == 999.0
+        main._response_budget.set((100, ""))
+        with pytest.raises(ValueError):
+            screener("stock_us_spot_em")
+    finally:
+        main._response_budget.reset(token)
+
+
+def test_top_k_not_capped_by_constant(snapshot):
+    response = screener("stock_us_spot_em", top_k=100)
+    assert response["returned_rows"] == 5
+    assert response["truncated"] is False